@@ -9,6 +9,7 @@ import sys
 import argparse
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
 from src.config.config import Config, get_config
 from src.utils.helper_functions import Logger
@@ -16,6 +17,8 @@ from src.etl.data_generator import DataGenerator, DataExporter
 from src.etl.etl_pipeline import ETLPipeline
 from src.spark.batch_processor import SparkBatchProcessor, SparkSessionManager
 from src.security.rbac_and_masking import RBACManager, DataGovernance
+from pipeline_utils import (StageMetrics, derive_seed, driver_available, instrumented,
+                            retry_with_backoff, retryable_errors, seeded_random)
 
 # Setup logging
 Logger.setup_logging('logs/main.log', 'INFO')
@@ -25,11 +28,13 @@ logger = logging.getLogger(__name__)
 class ProjectInitializer:
     """Initialize and run the entire project"""
     
-    def __init__(self, env: str = 'development'):
+    def __init__(self, env: str = 'development', metrics: Optional[StageMetrics] = None):
         self.config = get_config(env)
         self.env = env
+        self.metrics = metrics or StageMetrics()
         logger.info(f"Project Initializer created for {env} environment")
     
+    @instrumented('setup_directories')
     def setup_directories(self) -> bool:
         """Create necessary directories"""
         try:
@@ -52,35 +57,61 @@ class ProjectInitializer:
             logger.error(f"Failed to setup directories: {str(e)}")
             return False
     
-    def generate_sample_data(self) -> bool:
-        """Generate sample data for testing"""
+    @instrumented('generate_data')
+    def generate_sample_data(self, num_orders: int = 500, num_restaurants: int = 10,
+                             num_customers: int = 50, num_partners: int = 20,
+                             num_days: int = 365,
+                             seed: Optional[int] = None) -> bool:
+        """Generate sample data for testing
+        
+        When ``seed`` is given, each table is generated with its own seed derived
+        from it, so a table does not change when the row counts of others do.
+        """
         try:
             logger.info("Generating sample data...")
             generator = DataGenerator()
             exporter = DataExporter()
             
+            def table_seed(name: str) -> Optional[int]:
+                return derive_seed(seed, name) if seed is not None else None
+            
             # Generate data
-            dates = generator.generate_dates(365)
-            restaurants = generator.generate_restaurants(10)
-            customers = generator.generate_customers(50)
-            partners = generator.generate_delivery_partners(20)
-            orders = generator.generate_orders(500, 10, 50, 365)
-            deliveries = generator.generate_deliveries(500, 20)
+            with self.metrics.stage('generate'):
+                with seeded_random(table_seed('dates')):
+                    dates = generator.generate_dates(num_days)
+                with seeded_random(table_seed('restaurants')):
+                    restaurants = generator.generate_restaurants(num_restaurants)
+                with seeded_random(table_seed('customers')):
+                    customers = generator.generate_customers(num_customers)
+                with seeded_random(table_seed('partners')):
+                    partners = generator.generate_delivery_partners(num_partners)
+                with seeded_random(table_seed('orders')):
+                    orders = generator.generate_orders(num_orders, num_restaurants,
+                                                       num_customers, num_days)
+                with seeded_random(table_seed('deliveries')):
+                    deliveries = generator.generate_deliveries(num_orders, num_partners)
+                total_rows = (len(dates) + len(restaurants) + len(customers) +
+                              len(partners) + len(orders) + len(deliveries))
+                self.metrics.update(rows_out=total_rows)
             
             # Export data
-            exporter.export_to_json(dates, 'data/raw/dates.json')
-            exporter.export_to_json(restaurants, 'data/raw/restaurants.json')
-            exporter.export_to_json(customers, 'data/raw/customers.json')
-            exporter.export_to_json(partners, 'data/raw/partners.json')
-            exporter.export_to_json(orders, 'data/raw/orders.json')
-            exporter.export_to_json(deliveries, 'data/raw/deliveries.json')
+            with self.metrics.stage('export'):
+                exporter.export_to_json(dates, 'data/raw/dates.json')
+                exporter.export_to_json(restaurants, 'data/raw/restaurants.json')
+                exporter.export_to_json(customers, 'data/raw/customers.json')
+                exporter.export_to_json(partners, 'data/raw/partners.json')
+                exporter.export_to_json(orders, 'data/raw/orders.json')
+                exporter.export_to_json(deliveries, 'data/raw/deliveries.json')
+                self.metrics.update(rows_in=total_rows, rows_out=total_rows)
             
-            logger.info("Sample data generated successfully")
+            logger.info(f"Sample data generated successfully "
+                        f"({num_orders} orders, seed={seed})")
             return True
         except Exception as e:
             logger.error(f"Failed to generate sample data: {str(e)}")
             return False
     
+    @instrumented('run_etl')
     def run_etl_pipeline(self, use_postgresql: bool = True) -> bool:
         """Run ETL pipeline"""
         try:
@@ -90,8 +121,25 @@ class ProjectInitializer:
             
             pipeline = ETLPipeline(self.config, db_type=db_type)
             
-            if pipeline.connect():
-                stats = pipeline.execute_pipeline('data/raw')
+            # MAX_RETRIES counts retries after the first attempt. connect() reports
+            # failure as False, so only a missing driver can be told apart as
+            # permanent; other False results (bad credentials, unopenable paths)
+            # are retried like transient ones.
+            connect = retry_with_backoff(
+                max_retries=int(getattr(self.config, 'MAX_RETRIES', 3)),
+                retry_on=retryable_errors(db_type),
+                retry_on_false=True,
+                false_is_transient=lambda: driver_available(db_type),
+                metrics=self.metrics
+            )(pipeline.connect)
+            with self.metrics.stage('connect'):
+                connected = connect()
+            
+            if connected:
+                with self.metrics.stage('execute_pipeline'):
+                    stats = pipeline.execute_pipeline('data/raw')
+                    self.metrics.update(rows_in=stats['total_records_processed'],
+                                        rows_out=stats['successful_records'])
                 logger.info(f"ETL Pipeline Summary:")
                 logger.info(f"  Total Records: {stats['total_records_processed']}")
                 logger.info(f"  Successful: {stats['successful_records']}")
@@ -104,18 +152,22 @@ class ProjectInitializer:
             logger.error(f"ETL pipeline failed: {str(e)}")
             return False
     
+    @instrumented('batch_analytics')
     def run_batch_analytics(self) -> bool:
         """Run batch analytics with Spark"""
         try:
             logger.info("Starting batch analytics...")
             try:
-                processor = SparkBatchProcessor(self.config)
+                with self.metrics.stage('spark_session'):
+                    processor = SparkBatchProcessor(self.config)
                 
                 # Load sample data
-                orders_df = processor.load_json('data/raw/orders.json')
+                with self.metrics.stage('load_orders'):
+                    orders_df = processor.load_json('data/raw/orders.json')
                 if orders_df:
                     # Calculate metrics
-                    metrics = processor.calculate_daily_metrics(orders_df)
+                    with self.metrics.stage('daily_metrics'):
+                        metrics = processor.calculate_daily_metrics(orders_df)
                     if metrics:
                         logger.info("Daily metrics calculated successfully")
                         return True
@@ -130,6 +182,7 @@ class ProjectInitializer:
             logger.warning("Continuing without batch analytics - this is non-critical")
             return True
     
+    @instrumented('validate_security')
     def validate_security_setup(self) -> bool:
         """Validate security configuration"""
         try:
@@ -205,6 +258,18 @@ def main():
                        help='Setup project directories')
     parser.add_argument('--generate-data', action='store_true',
                        help='Generate sample data')
+    parser.add_argument('--num-orders', type=int, default=500,
+                       help='Number of orders (and deliveries) to generate')
+    parser.add_argument('--num-restaurants', type=int, default=10,
+                       help='Number of restaurants to generate')
+    parser.add_argument('--num-customers', type=int, default=50,
+                       help='Number of customers to generate')
+    parser.add_argument('--num-partners', type=int, default=20,
+                       help='Number of delivery partners to generate')
+    parser.add_argument('--num-days', type=int, default=365,
+                       help='Number of days covered by the date dimension')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Master seed for reproducible data generation')
     parser.add_argument('--run-etl', action='store_true',
                        help='Run ETL pipeline')
     parser.add_argument('--batch-analytics', action='store_true',
@@ -213,11 +278,19 @@ def main():
                        help='Validate security setup')
     parser.add_argument('--full-init', action='store_true',
                        help='Run complete initialization')
+    parser.add_argument('--metrics-file', default='logs/metrics.jsonl',
+                       help='JSON lines file for per-stage timing metrics')
+    parser.add_argument('--prometheus-file', default=None,
+                       help='Also write stage metrics in Prometheus text format')
+    parser.add_argument('--profile', action='store_true',
+                       help='Dump cProfile output per stage to reports/profiles')
     
     args = parser.parse_args()
     
     # Initialize project
-    initializer = ProjectInitializer(args.env)
+    metrics = StageMetrics(args.metrics_file,
+                           profile_dir='reports/profiles' if args.profile else None)
+    initializer = ProjectInitializer(args.env, metrics=metrics)
     
     try:
         # Setup directories
@@ -228,7 +301,13 @@ def main():
         # Generate sample data
         if args.generate_data or args.full_init:
             print("[*] Generating sample data...")
-            if initializer.generate_sample_data():
+            if initializer.generate_sample_data(
+                    num_orders=args.num_orders,
+                    num_restaurants=args.num_restaurants,
+                    num_customers=args.num_customers,
+                    num_partners=args.num_partners,
+                    num_days=args.num_days,
+                    seed=args.seed):
                 print("   [OK] Sample data generated")
             else:
                 print("   [FAIL] Failed to generate sample data")
@@ -257,6 +336,9 @@ def main():
             else:
                 print("   [FAIL] Security validation failed")
         
+        if args.prometheus_file:
+            metrics.write_prometheus(args.prometheus_file)
+        
         # Print summary
         initializer.print_summary()
         
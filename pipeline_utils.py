@@ -0,0 +1,315 @@
+"""
+Pipeline Utilities for Food Delivery Operations Analytics
+Stage instrumentation, seeding and retry helpers used by main.py
+"""
+
+import cProfile
+import functools
+import hashlib
+import importlib.util
+import json
+import logging
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    from prometheus_client import CollectorRegistry, Gauge, write_to_textfile
+except ImportError:
+    CollectorRegistry = None
+
+logger = logging.getLogger(__name__)
+
+
+def derive_seed(master_seed: int, name: str) -> int:
+    """Derive a stable per-table seed from the master seed"""
+    digest = hashlib.sha256(f"{master_seed}:{name}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+@contextmanager
+def seeded_random(seed: Optional[int]):
+    """Seed the global random module for the block, then restore its previous state"""
+    if seed is None:
+        yield
+        return
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(state)
+
+
+def _process_peak_rss_bytes() -> Optional[int]:
+    """Lifetime peak resident set size of this process, if the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _cpu_time() -> float:
+    """CPU time of this process plus any child processes it has reaped"""
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+
+class StageMetrics:
+    """Collect wall time, CPU time, peak RSS and throughput for pipeline stages
+    
+    Stages opened inside another stage are recorded as its sub-steps. A stage that
+    does not set its own row counts takes rows_in from its first sub-step that
+    reports one and rows_out from its last.
+    """
+    
+    def __init__(self, metrics_file: Optional[str] = 'logs/metrics.jsonl',
+                 profile_dir: Optional[str] = None):
+        self.metrics_file = Path(metrics_file) if metrics_file else None
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        # Timestamp for readability, random suffix so runs in the same second differ
+        self.run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:12]}"
+        self.records: List[Dict] = []
+        self._stack: List[Dict] = []
+        self._children: List[List[Dict]] = []
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a stage for the duration of the block"""
+        parent = self._stack[-1]['stage'] if self._stack else None
+        record = {
+            'run_id': self.run_id,
+            'stage': f"{parent}/{name}" if parent else name,
+            'parent': parent,
+            'started_at': datetime.now().isoformat(),
+            'rows_in': None,
+            'rows_out': None,
+            'success': True,
+        }
+        profiler = None
+        if self.profile_dir and parent is None:
+            profiler = cProfile.Profile()
+        
+        self._stack.append(record)
+        self._children.append([])
+        rss_start = _process_peak_rss_bytes()
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        except Exception:
+            record['success'] = False
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = _cpu_time() - cpu_start
+            rss_end = _process_peak_rss_bytes()
+            self._stack.pop()
+            children = self._children.pop()
+            if self._children:
+                self._children[-1].append(record)
+            
+            if record['rows_in'] is None:
+                record['rows_in'] = next(
+                    (c['rows_in'] for c in children if c['rows_in'] is not None), None)
+            if record['rows_out'] is None:
+                record['rows_out'] = next(
+                    (c['rows_out'] for c in reversed(children) if c['rows_out'] is not None),
+                    None)
+            
+            record['wall_time_s'] = round(wall_time, 6)
+            record['cpu_time_s'] = round(cpu_time, 6)
+            record['process_peak_rss_bytes'] = rss_end
+            record['peak_rss_growth_bytes'] = (
+                rss_end - rss_start if rss_end is not None else None
+            )
+            rows = record['rows_out'] if record['rows_out'] is not None else record['rows_in']
+            record['rows_per_sec'] = (
+                round(rows / wall_time, 2) if rows is not None and wall_time > 0 else None
+            )
+            
+            if profiler:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(str(self.profile_dir / f"{self.run_id}_{name}.prof"))
+            self._emit(record)
+    
+    def update(self, **fields):
+        """Set fields such as rows_in/rows_out on the innermost open stage"""
+        if self._stack:
+            self._stack[-1].update(fields)
+    
+    def _emit(self, record: Dict):
+        """Append the record to the JSON lines file"""
+        self.records.append(record)
+        logger.info(f"Stage {record['stage']}: {record['wall_time_s']:.3f}s wall, "
+                    f"{record['cpu_time_s']:.3f}s CPU, rows/sec={record['rows_per_sec']}")
+        if self.metrics_file:
+            try:
+                self.metrics_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.metrics_file, 'a', encoding='utf-8') as fh:
+                    fh.write(json.dumps(record) + '\n')
+            except OSError as e:
+                logger.warning(f"Failed to write stage metrics: {str(e)}")
+    
+    def write_prometheus(self, path: str) -> bool:
+        """Write the collected stage metrics in Prometheus text format"""
+        if CollectorRegistry is None:
+            logger.warning("prometheus-client not installed, skipping Prometheus metrics")
+            return False
+        
+        registry = CollectorRegistry()
+        gauges = {
+            'wall_time_s': Gauge('pipeline_stage_wall_seconds',
+                                 'Stage wall time', ['stage'], registry=registry),
+            'cpu_time_s': Gauge('pipeline_stage_cpu_seconds',
+                                'Stage CPU time including reaped child processes',
+                                ['stage'], registry=registry),
+            'process_peak_rss_bytes': Gauge('pipeline_process_peak_rss_bytes',
+                                            'Process peak RSS at stage end',
+                                            ['stage'], registry=registry),
+            'peak_rss_growth_bytes': Gauge('pipeline_stage_peak_rss_growth_bytes',
+                                           'Growth of process peak RSS during stage',
+                                           ['stage'], registry=registry),
+            'rows_in': Gauge('pipeline_stage_rows_in',
+                             'Rows read by stage', ['stage'], registry=registry),
+            'rows_out': Gauge('pipeline_stage_rows_out',
+                              'Rows written by stage', ['stage'], registry=registry),
+            'rows_per_sec': Gauge('pipeline_stage_rows_per_second',
+                                  'Stage throughput', ['stage'], registry=registry),
+        }
+        for record in self.records:
+            for field, gauge in gauges.items():
+                if record.get(field) is not None:
+                    gauge.labels(stage=record['stage']).set(record[field])
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        write_to_textfile(path, registry)
+        logger.info(f"Prometheus metrics written to {path}")
+        return True
+
+
+# Private generator so backoff jitter stays random after seeded_random() is used
+_jitter = random.SystemRandom()
+
+
+_DRIVER_MODULES = {
+    'sqlite': 'sqlite3',
+    'postgresql': 'psycopg2',
+    'snowflake': 'snowflake.connector',
+}
+
+
+def driver_available(db_type: str) -> bool:
+    """Whether the client library for the given database can be imported"""
+    module = _DRIVER_MODULES.get(db_type)
+    if module is None:
+        return False
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ImportError:  # Parent package of a dotted module name is missing
+        return False
+
+
+def retryable_errors(db_type: str) -> Tuple[type, ...]:
+    """Exception types that signal a transient failure for the given database"""
+    errors = [ConnectionError, TimeoutError]
+    if db_type == 'sqlite':
+        import sqlite3
+        errors.append(sqlite3.OperationalError)
+    elif db_type == 'postgresql':
+        try:
+            import psycopg2
+            errors.extend([psycopg2.OperationalError, psycopg2.InterfaceError])
+        except ImportError:
+            pass
+    elif db_type == 'snowflake':
+        try:
+            from snowflake.connector import errors as snowflake_errors
+            errors.extend([snowflake_errors.OperationalError,
+                           snowflake_errors.InterfaceError])
+        except ImportError:
+            pass
+    return tuple(errors)
+
+
+def retry_with_backoff(max_retries: int = 3, base_delay: float = 1.0,
+                       max_delay: float = 30.0,
+                       retry_on: Tuple[type, ...] = (ConnectionError, TimeoutError),
+                       retry_on_false: bool = False,
+                       false_is_transient: Optional[Callable[[], bool]] = None,
+                       metrics: Optional[StageMetrics] = None):
+    """Decorator that retries a call with exponential backoff and full jitter
+    
+    The call is made at most ``max_retries + 1`` times. Exceptions in ``retry_on``
+    are retried and anything else propagates immediately. With ``retry_on_false``
+    a falsy return value is retried too, for calls such as connect() that report
+    failure by returning False. Such a result carries no error to classify, so
+    ``false_is_transient`` is consulted first when given; if it returns False the
+    failure is treated as permanent and returned without retrying. Retry count and
+    backoff time are recorded on the innermost open stage of ``metrics``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            retries = 0
+            backoff_time = 0.0
+            try:
+                while True:
+                    try:
+                        result = func(*args, **kwargs)
+                        error = None
+                    except retry_on as e:
+                        result, error = None, e
+                    
+                    if error is None and (result or not retry_on_false):
+                        return result
+                    if error is None and false_is_transient and not false_is_transient():
+                        logger.error(f"{func.__name__} failed permanently, not retrying")
+                        return result
+                    if retries >= max_retries:
+                        if error is not None:
+                            raise error
+                        return result
+                    
+                    delay = _jitter.uniform(0, min(max_delay, base_delay * (2 ** retries)))
+                    retries += 1
+                    logger.warning(f"Attempt {retries} of {func.__name__} failed "
+                                   f"({error or 'returned False'}), retrying in {delay:.2f}s")
+                    time.sleep(delay)
+                    backoff_time += delay
+            finally:
+                if metrics:
+                    metrics.update(retries=retries, backoff_s=round(backoff_time, 3))
+        return wrapper
+    return decorator
+
+
+def instrumented(name: str):
+    """Run a method of an object with a ``metrics`` attribute as a measured stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name) as record:
+                result = func(self, *args, **kwargs)
+                record['success'] = bool(result)
+                return result
+        return wrapper
+    return decorator
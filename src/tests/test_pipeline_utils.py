@@ -0,0 +1,273 @@
+"""Tests for pipeline_utils stage metrics and seeding helpers"""
+
+import json
+import random
+import sqlite3
+import time
+
+import pytest
+
+import pipeline_utils
+from pipeline_utils import (StageMetrics, derive_seed, driver_available, instrumented,
+                            retry_with_backoff, retryable_errors, seeded_random)
+
+
+class TestStageMetrics:
+    """Test stage timing, nesting and output"""
+
+    def test_nested_stage_names(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with metrics.stage('run_etl'):
+            with metrics.stage('connect'):
+                pass
+
+        stages = [(r['stage'], r['parent']) for r in metrics.records]
+        assert stages == [('run_etl/connect', 'run_etl'), ('run_etl', None)]
+
+    def test_rows_per_sec(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with metrics.stage('load'):
+            time.sleep(0.02)
+            metrics.update(rows_in=100, rows_out=80)
+
+        record = metrics.records[0]
+        assert record['rows_out'] == 80
+        assert record['rows_per_sec'] == pytest.approx(80 / record['wall_time_s'], rel=0.01)
+
+    def test_stage_without_rows_has_no_throughput(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with metrics.stage('setup_directories'):
+            pass
+
+        assert metrics.records[0]['rows_per_sec'] is None
+
+    def test_parent_takes_rows_from_first_and_last_children(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with metrics.stage('generate_data'):
+            with metrics.stage('generate'):
+                metrics.update(rows_out=50)
+            with metrics.stage('export'):
+                metrics.update(rows_in=50, rows_out=45)
+
+        parent = metrics.records[-1]
+        assert parent['stage'] == 'generate_data'
+        assert parent['rows_in'] == 50
+        assert parent['rows_out'] == 45
+
+    def test_parent_rows_set_explicitly_are_kept(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with metrics.stage('outer'):
+            with metrics.stage('inner'):
+                metrics.update(rows_out=10)
+            metrics.update(rows_out=7)
+
+        assert metrics.records[-1]['rows_out'] == 7
+
+    def test_exception_marks_stage_failed(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+        with pytest.raises(RuntimeError):
+            with metrics.stage('outer'):
+                with metrics.stage('inner'):
+                    raise RuntimeError('boom')
+
+        assert [r['success'] for r in metrics.records] == [False, False]
+
+    def test_instrumented_records_return_value(self, tmp_path):
+        class Runner:
+            def __init__(self):
+                self.metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+
+            @instrumented('step')
+            def step(self, ok):
+                return ok
+
+        runner = Runner()
+        assert runner.step(False) is False
+        assert runner.metrics.records[0]['success'] is False
+
+    def test_jsonl_output(self, tmp_path):
+        path = tmp_path / 'logs' / 'metrics.jsonl'
+        metrics = StageMetrics(str(path))
+        with metrics.stage('a'):
+            pass
+        with metrics.stage('b'):
+            pass
+
+        lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        assert [line['stage'] for line in lines] == ['a', 'b']
+        assert all(line['run_id'] == metrics.run_id for line in lines)
+        for field in ('wall_time_s', 'cpu_time_s', 'process_peak_rss_bytes',
+                      'peak_rss_growth_bytes', 'rows_per_sec'):
+            assert field in lines[0]
+
+    def test_run_id_unique_per_instance(self, tmp_path):
+        path = str(tmp_path / 'metrics.jsonl')
+        assert StageMetrics(path).run_id != StageMetrics(path).run_id
+
+    def test_profile_only_top_level_stages(self, tmp_path):
+        metrics = StageMetrics(None, profile_dir=str(tmp_path / 'profiles'))
+        with metrics.stage('outer'):
+            with metrics.stage('inner'):
+                pass
+
+        profiles = [p.name for p in (tmp_path / 'profiles').iterdir()]
+        assert profiles == [f"{metrics.run_id}_outer.prof"]
+
+
+class TestSeeding:
+    """Test deterministic seeding helpers"""
+
+    def test_derive_seed_is_stable(self):
+        assert derive_seed(42, 'orders') == derive_seed(42, 'orders')
+        assert derive_seed(42, 'orders') != derive_seed(42, 'deliveries')
+        assert derive_seed(42, 'orders') != derive_seed(43, 'orders')
+
+    def test_seeded_random_is_reproducible(self):
+        with seeded_random(7):
+            first = [random.random() for _ in range(3)]
+        with seeded_random(7):
+            second = [random.random() for _ in range(3)]
+        assert first == second
+
+    def test_seeded_random_restores_global_state(self):
+        state = random.getstate()
+        with seeded_random(7):
+            random.random()
+        assert random.getstate() == state
+
+
+class TestRetryWithBackoff:
+    """Test retry attempts, error classification and jitter"""
+
+    @pytest.fixture(autouse=True)
+    def no_sleep(self, monkeypatch):
+        self.delays = []
+        monkeypatch.setattr(pipeline_utils.time, 'sleep', self.delays.append)
+
+    def test_attempts_are_retries_plus_one(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=3)
+        def connect():
+            calls.append(1)
+            raise ConnectionError('refused')
+
+        with pytest.raises(ConnectionError):
+            connect()
+        assert len(calls) == 4
+        assert len(self.delays) == 3
+
+    def test_returns_once_call_succeeds(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=3, retry_on_false=True)
+        def connect():
+            calls.append(1)
+            return len(calls) == 2
+
+        assert connect() is True
+        assert len(calls) == 2
+
+    def test_false_result_returned_when_retries_exhausted(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=1, retry_on_false=True)
+        def connect():
+            calls.append(1)
+            return False
+
+        assert connect() is False
+        assert len(calls) == 2
+
+    def test_false_result_not_retried_by_default(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=3)
+        def lookup():
+            calls.append(1)
+            return []
+
+        assert lookup() == []
+        assert len(calls) == 1
+
+    def test_permanent_false_result_is_not_retried(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=3, retry_on_false=True,
+                            false_is_transient=lambda: driver_available('mysql'))
+        def connect():
+            calls.append(1)
+            return False
+
+        assert connect() is False
+        assert len(calls) == 1
+        assert self.delays == []
+
+    def test_transient_false_result_is_retried(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=2, retry_on_false=True,
+                            false_is_transient=lambda: driver_available('sqlite'))
+        def connect():
+            calls.append(1)
+            return False
+
+        assert connect() is False
+        assert len(calls) == 3
+
+    def test_non_retryable_error_propagates_immediately(self):
+        calls = []
+
+        @retry_with_backoff(max_retries=3, retry_on=retryable_errors('sqlite'))
+        def connect():
+            calls.append(1)
+            raise ImportError('missing driver')
+
+        with pytest.raises(ImportError):
+            connect()
+        assert len(calls) == 1
+        assert self.delays == []
+
+    def test_delays_are_capped_exponential(self):
+        @retry_with_backoff(max_retries=5, base_delay=1.0, max_delay=4.0)
+        def connect():
+            raise TimeoutError()
+
+        with pytest.raises(TimeoutError):
+            connect()
+        caps = [1.0, 2.0, 4.0, 4.0, 4.0]
+        assert all(0 <= delay <= cap for delay, cap in zip(self.delays, caps))
+
+    def test_jitter_ignores_seeded_global_random(self):
+        @retry_with_backoff(max_retries=3)
+        def connect():
+            raise ConnectionError()
+
+        runs = []
+        for _ in range(2):
+            self.delays.clear()
+            with seeded_random(1):
+                with pytest.raises(ConnectionError):
+                    connect()
+            runs.append(list(self.delays))
+        assert runs[0] != runs[1]
+
+    def test_records_retries_on_open_stage(self, tmp_path):
+        metrics = StageMetrics(str(tmp_path / 'metrics.jsonl'))
+
+        @retry_with_backoff(max_retries=2, retry_on_false=True, metrics=metrics)
+        def connect():
+            return False
+
+        with metrics.stage('connect'):
+            connect()
+        assert metrics.records[0]['retries'] == 2
+        assert metrics.records[0]['backoff_s'] == round(sum(self.delays), 3)
+
+    def test_driver_available(self):
+        assert driver_available('sqlite')
+        assert not driver_available('mysql')
+
+    def test_sqlite_operational_error_is_retryable(self):
+        assert sqlite3.OperationalError in retryable_errors('sqlite')
+        assert ConnectionError in retryable_errors('postgresql')